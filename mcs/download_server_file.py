@@ -2,42 +2,118 @@ import argparse
 import requests
 import sys
 import os
+import re
+import json
+import atexit
+import functools
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from packaging import version as packaging_version
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 BASE_URL = "https://api.papermc.io/v2/projects/paper/"
+BUILDS_URL_TEMPLATE = BASE_URL + "versions/{}/builds/"
+DOWNLOAD_URL_TEMPLATE = BUILDS_URL_TEMPLATE + "{}/downloads/{}"
+TIMEOUT = (3.05, 30)  # (connect, read) seconds
+MAX_PARALLEL_REQUESTS = 8
+DOWNLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+_PRE_RELEASE = re.compile(r"-pre(\d+)")
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "mcs", "papermc.json")
+
+# One pooled session so every API call reuses the same TLS connection.
+_session = requests.Session()
+_session.headers["User-Agent"] = "MCSv2 (https://github.com/HyperRays/MCSv2)"
+_session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+))
+
+_http_cache = None
+_http_cache_lock = threading.Lock()
 
 def versions_endpoint():
     return BASE_URL
 
 def builds_endpoint(version):
-    return f"{BASE_URL}versions/{version}/builds/"
+    return BUILDS_URL_TEMPLATE.format(version)
 
 def downloads_endpoint(version, build, file_name):
-    return f"{builds_endpoint(version)}{build}/downloads/{file_name}"
-
-builds_cache = {}
-
+    return DOWNLOAD_URL_TEMPLATE.format(version, build, file_name)
+
+def version_key(version):
+    """Sort key for Minecraft versions; '-preN' snapshots sort as alpha pre-releases."""
+    return packaging_version.parse(_PRE_RELEASE.sub(r"a\1", version))
+
+def _load_http_cache():
+    """Load the on-disk API response cache once and save it again at exit."""
+    global _http_cache
+    with _http_cache_lock:
+        if _http_cache is None:
+            try:
+                with open(CACHE_PATH, "r") as f:
+                    _http_cache = json.load(f)
+            except (OSError, ValueError):
+                _http_cache = {}
+            atexit.register(_save_http_cache)
+    return _http_cache
+
+def _save_http_cache():
+    """Atomically write the API response cache to disk."""
+    try:
+        os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+        tmp_path = f"{CACHE_PATH}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(_http_cache, f)
+        os.replace(tmp_path, CACHE_PATH)
+    except OSError as e:
+        print(f"Failed to save API cache to {CACHE_PATH}: {e}")
+
+def _get_json(url, field):
+    """GET one field of a JSON endpoint, revalidating any cached copy with ETag/Last-Modified."""
+    cache = _load_http_cache()
+    entry = cache.get(url)
+    if not isinstance(entry, dict) or "value" not in entry:
+        entry = None  # Missing, stale-format or damaged entry: do a plain GET
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    r = _session.get(url, headers=headers, timeout=TIMEOUT)
+    if r.status_code == 304:
+        if entry:
+            return entry["value"]
+        # Nothing cached to fall back on: treat it as a miss and fetch the full body
+        r = _session.get(url, timeout=TIMEOUT)
+        if r.status_code == 304:
+            raise requests.HTTPError(f"Unexpected 304 Not Modified for {url}", response=r)
+    r.raise_for_status()
+    value = r.json()[field]
+    etag = r.headers.get("ETag")
+    last_modified = r.headers.get("Last-Modified")
+    if etag or last_modified:
+        cache[url] = {"etag": etag, "last_modified": last_modified, "value": value}
+    return value
+
+@functools.lru_cache(maxsize=1)
 def get_versions_available():
     """Retrieve all available versions."""
     try:
-        r = requests.get(versions_endpoint())
-        r.raise_for_status()
-        properties = r.json()
-        return properties["versions"]
+        return _get_json(versions_endpoint(), "versions")
     except requests.RequestException as e:
         print(f"Failed to retrieve versions: {e}")
         sys.exit(1)
 
+@functools.lru_cache(maxsize=None)
 def get_builds(version):
     """Get builds for a given version, with caching."""
-    if version in builds_cache:
-        return builds_cache[version]
     try:
-        r = requests.get(builds_endpoint(version))
-        r.raise_for_status()
-        properties = r.json()
-        builds_cache[version] = properties["builds"]
-        return builds_cache[version]
+        return _get_json(builds_endpoint(version), "builds")
     except requests.RequestException as e:
         print(f"Failed to retrieve builds for version {version}: {e}")
         sys.exit(1)
@@ -52,65 +128,70 @@ def get_non_experimental_builds(version):
     builds = get_builds(version)
     return [build for build in builds if build["channel"] != "experimental"]
 
-def check_for_stable():
-    """Check for stable versions."""
+@functools.lru_cache(maxsize=1)
+def get_stable_versions():
+    """Return all versions with at least one non-experimental build, newest first."""
     versions = get_versions_available()
-    stable_versions = {}
-    for version in versions:
-        is_stable = not only_experimental(version)
-        stable_versions[version] = is_stable
-    return stable_versions
-
-def download_file(url, download_folder):
-    """Download a file from a URL to a specified folder."""
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_REQUESTS) as executor:
+        experimental_only = executor.map(only_experimental, versions)
+        stable_versions = [
+            version for version, is_experimental in zip(versions, experimental_only)
+            if not is_experimental
+        ]
+    # A tuple, so callers cannot mutate the cached result
+    return tuple(sorted(stable_versions, key=version_key, reverse=True))
+
+def download_file(url, download_folder, sha256=None):
+    """Download a file from a URL to a specified folder, verifying its SHA-256 if given."""
     local_filename = os.path.basename(url)
     download_path = os.path.join(download_folder, local_filename)
-    
+    # Stream into a temporary file so a failed download never touches an existing jar
+    partial_path = f"{download_path}.part"
+
     try:
         os.makedirs(download_folder, exist_ok=True)  # Ensure the folder exists
-        with requests.get(url, stream=True) as r:
+        with _session.get(url, stream=True, timeout=TIMEOUT) as r:
             r.raise_for_status()
-            with open(download_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+            with open(partial_path, 'wb') as f:
+                # os.sendfile cannot be used here: the socket carries TLS records, not
+                # the jar bytes, and Linux sendfile cannot read from a socket anyway.
+                digest = hashlib.sha256()
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+        if sha256 and digest.hexdigest() != sha256:
+            print(f"Error: Checksum mismatch for {local_filename} (expected {sha256}, got {digest.hexdigest()}).")
+            sys.exit(1)
+        os.replace(partial_path, download_path)
         print(f"Downloaded {local_filename} to {download_path}")
         return local_filename
-    except requests.RequestException as e:
+    except (requests.RequestException, OSError) as e:
         print(f"Failed to download file from {url}: {e}")
         sys.exit(1)
-
-def batched_it(iterable, n):
-    """Batch data into lists of length n. The last batch may be shorter."""
-    for i in range(0, len(iterable), n):
-        yield iterable[i:i + n]
+    finally:
+        # Never leave a partial or unverified download behind
+        if os.path.exists(partial_path):
+            os.unlink(partial_path)
 
 def query_version_infos():
     """Generate a formatted list of stable versions."""
-    stable_versions = [version for version, is_stable in check_for_stable().items() if is_stable]
-    stable_versions_sorted = sorted(stable_versions, key=packaging_version.parse, reverse=True)
-    log_str = "[Stable Versions]\n"
-    for batch in batched_it(stable_versions_sorted, 7):
-        log_str += ", ".join(batch) + "\n"
-    print(log_str)
+    versions = get_stable_versions()
+    lines = [", ".join(versions[i:i + 7]) for i in range(0, len(versions), 7)]
+    sys.stdout.write("[Stable Versions]\n" + "\n".join(lines) + "\n")
 
 def main(version, folder):
     """Main function to check for latest version, get build, and download."""
-    stable_versions = [v for v, is_stable in check_for_stable().items() if is_stable]
-    if version not in stable_versions:
-        print(f"Error: Version {version} is not stable or does not exist.")
-        sys.exit(1)
-    
+    # Only this version's builds are needed; get_builds exits if it does not exist.
     builds = get_non_experimental_builds(version)
     if not builds:
-        print(f"Error: No non-experimental builds found for version {version}.")
+        print(f"Error: Version {version} is not stable (no non-experimental builds found).")
         sys.exit(1)
     
     selected_build = builds[-1]  # Assuming the last build is the latest
     build_no = selected_build["build"]
-    build_file = selected_build["downloads"]["application"]["name"]
-    download_url = downloads_endpoint(version, build_no, build_file)
-    return download_file(download_url, folder)
+    application = selected_build["downloads"]["application"]
+    download_url = downloads_endpoint(version, build_no, application["name"])
+    return download_file(download_url, folder, sha256=application.get("sha256"))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="PaperMC CLI Utility")
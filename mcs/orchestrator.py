@@ -1,23 +1,73 @@
 import os
+import re
 import subprocess
-import fnmatch
 import argparse
-import threading
+import selectors
 import sys
+from packaging import version as packaging_version
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+OUTPUT_READ_SIZE = 1 << 16
+PIPE_BUFFER_SIZE = 1 << 20
+PAPER_JAR_PATTERN = re.compile(r"paper-(.+)-(\d+)\.jar$")
+# Same '-preN' -> alpha normalization as download_server_file.version_key; this script
+# is copied into the server directory on its own, so it cannot import that module
+PRE_RELEASE_PATTERN = re.compile(r"-pre(\d+)")
+
+# Aikar's flags for the PaperMC JVM
+JAVA_FLAGS = (
+    '-Xms4096M',
+    '-Xmx4096M',
+    '--add-modules=jdk.incubator.vector',
+    '-XX:+UseG1GC',
+    '-XX:+ParallelRefProcEnabled',
+    '-XX:MaxGCPauseMillis=200',
+    '-XX:+UnlockExperimentalVMOptions',
+    '-XX:+DisableExplicitGC',
+    '-XX:+AlwaysPreTouch',
+    '-XX:G1HeapWastePercent=5',
+    '-XX:G1MixedGCCountTarget=4',
+    '-XX:InitiatingHeapOccupancyPercent=15',
+    '-XX:G1MixedGCLiveThresholdPercent=90',
+    '-XX:G1RSetUpdatingPauseTimePercent=5',
+    '-XX:SurvivorRatio=32',
+    '-XX:+PerfDisableSharedMem',
+    '-XX:MaxTenuringThreshold=1',
+    '-Dusing.aikars.flags=https://mcflags.emc.gs',
+    '-Daikars.new.flags=true',
+    '-XX:G1NewSizePercent=30',
+    '-XX:G1MaxNewSizePercent=40',
+    '-XX:G1HeapRegionSize=8M',
+    '-XX:G1ReservePercent=20',
+)
 
 def find_latest_paper_jar(directory):
     """
     Search for the latest PaperMC JAR file in the specified directory.
     Assumes JAR files are named in the format 'paper-<version>-<build>.jar'.
     """
-    jar_files = fnmatch.filter(os.listdir(directory), 'paper-*.jar')
-    if not jar_files:
-        raise FileNotFoundError("No PaperMC JAR files found in the specified directory.")
+    latest_key, latest_jar = None, None
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            match = PAPER_JAR_PATTERN.match(entry.name)
+            if not match:
+                continue
+            # Compare versions numerically so that e.g. 1.21.10 beats 1.21.9
+            try:
+                jar_version = packaging_version.parse(PRE_RELEASE_PATTERN.sub(r"a\1", match.group(1)))
+            except packaging_version.InvalidVersion:
+                continue
+            key = (jar_version, int(match.group(2)))
+            if latest_key is None or key > latest_key:
+                latest_key, latest_jar = key, entry.path
 
-    # Sort JAR files to find the latest one
-    jar_files.sort(reverse=True)
-    latest_jar = jar_files[0]
-    return os.path.join(directory, latest_jar)
+    if latest_jar is None:
+        raise FileNotFoundError("No PaperMC JAR files found in the specified directory.")
+    return latest_jar
 
 def read_commands_from_file(file_path):
     """
@@ -30,39 +80,94 @@ def read_commands_from_file(file_path):
         commands = [line.strip() for line in file if line.strip()]
     return commands
 
+def send_command(server_process, command):
+    """
+    Send a single console command to the running server.
+    """
+    server_process.stdin.write(command.encode() + b"\n")
+    server_process.stdin.flush()
+
+def pump_server_io(server_process, interactive):
+    """
+    Forward server stdout/stderr to the console (and, in interactive mode, console
+    input to the server) from a single selector loop until the server closes its output.
+    """
+    outputs = {
+        server_process.stdout.fileno(): sys.stdout.buffer,
+        server_process.stderr.fileno(): sys.stderr.buffer,
+    }
+    stdin_fd = sys.stdin.fileno()
+    pending_input = b""
+    stopping = False
+
+    def prompt():
+        sys.stdout.write("> ")
+        sys.stdout.flush()
+
+    with selectors.DefaultSelector() as selector:
+        for fd in outputs:
+            selector.register(fd, selectors.EVENT_READ)
+
+        def stop_server():
+            nonlocal stopping
+            stopping = True
+            print("Stopping the server...", flush=True)
+            try:
+                send_command(server_process, "stop")
+            except BrokenPipeError:
+                pass  # The server has already exited
+            if stdin_fd in selector.get_map():
+                selector.unregister(stdin_fd)
+
+        if interactive:
+            try:
+                selector.register(stdin_fd, selectors.EVENT_READ)
+                prompt()
+            except (PermissionError, ValueError):
+                # stdin is /dev/null or a regular file (e.g. `docker run` without -i) and
+                # cannot be polled; treat it as already at end of input
+                stop_server()
+
+        while outputs:
+            try:
+                for key, _ in selector.select():
+                    data = os.read(key.fd, OUTPUT_READ_SIZE)
+                    if key.fd in outputs:
+                        if data:
+                            outputs[key.fd].write(data)
+                            outputs[key.fd].flush()
+                        else:
+                            selector.unregister(key.fd)
+                            del outputs[key.fd]
+                    elif not data:
+                        print()
+                        stop_server()
+                    else:
+                        pending_input += data
+                        *lines, pending_input = pending_input.split(b"\n")
+                        for line in lines:
+                            if line.strip().lower() in {b"exit", b"quit", b"stop"}:
+                                stop_server()
+                                break
+                            server_process.stdin.write(line + b"\n")
+                        else:
+                            server_process.stdin.flush()
+                            if lines:
+                                prompt()
+            except KeyboardInterrupt:
+                print()
+                if stopping:
+                    # Second Ctrl-C: the server did not shut down on "stop", so kill it
+                    print("Terminating the server...", flush=True)
+                    server_process.terminate()
+                    return
+                stop_server()
+
 def run_java_server(jar_path, interactive=True, command_file=None):
     """
     Start the PaperMC server, with optional interactive shell and automated commands.
     """
-    java_command = [
-        'java',
-        '-Xms4096M',
-        '-Xmx4096M',
-        '--add-modules=jdk.incubator.vector',
-        '-XX:+UseG1GC',
-        '-XX:+ParallelRefProcEnabled',
-        '-XX:MaxGCPauseMillis=200',
-        '-XX:+UnlockExperimentalVMOptions',
-        '-XX:+DisableExplicitGC',
-        '-XX:+AlwaysPreTouch',
-        '-XX:G1HeapWastePercent=5',
-        '-XX:G1MixedGCCountTarget=4',
-        '-XX:InitiatingHeapOccupancyPercent=15',
-        '-XX:G1MixedGCLiveThresholdPercent=90',
-        '-XX:G1RSetUpdatingPauseTimePercent=5',
-        '-XX:SurvivorRatio=32',
-        '-XX:+PerfDisableSharedMem',
-        '-XX:MaxTenuringThreshold=1',
-        '-Dusing.aikars.flags=https://mcflags.emc.gs',
-        '-Daikars.new.flags=true',
-        '-XX:G1NewSizePercent=30',
-        '-XX:G1MaxNewSizePercent=40',
-        '-XX:G1HeapRegionSize=8M',
-        '-XX:G1ReservePercent=20',
-        '-jar',
-        jar_path,
-        '--nogui'
-    ]
+    java_command = ('java', *JAVA_FLAGS, '-jar', jar_path, '--nogui')
 
     automated_commands = []
     if command_file:
@@ -75,56 +180,32 @@ def run_java_server(jar_path, interactive=True, command_file=None):
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1
+            bufsize=0
         )
 
-        def read_server_output():
-            """
-            Continuously read and print server output to the console.
-            """
-            try:
-                while True:
-                    output = server_process.stdout.readline()
-                    if output == "" and server_process.poll() is not None:
-                        break
-                    if output:
-                        print(output, end="")
-            except Exception as e:
-                print(f"Error reading server output: {e}", file=sys.stderr)
-
-        # Start a thread to read server output
-        output_thread = threading.Thread(target=read_server_output, daemon=True)
-        output_thread.start()
+        if fcntl is not None and hasattr(fcntl, "F_SETPIPE_SZ"):
+            # A larger pipe lets the JVM write more log output before we have to wake up
+            for pipe in (server_process.stdout, server_process.stderr):
+                try:
+                    fcntl.fcntl(pipe.fileno(), fcntl.F_SETPIPE_SZ, PIPE_BUFFER_SIZE)
+                except OSError:
+                    pass
 
         if automated_commands:
             print("Running automated commands...")
             for command in automated_commands:
                 print(f"Executing: {command}")
-                server_process.stdin.write(command + "\n")
-                server_process.stdin.flush()
+                send_command(server_process, command)
 
         if interactive:
             print("Minecraft server started. Type commands to interact with the server.")
-            while True:
-                try:
-                    command = input("> ")
-                    if command.strip().lower() in {"exit", "quit", "stop"}:
-                        print("Stopping the server...")
-                        server_process.stdin.write("stop\n")
-                        server_process.stdin.flush()
-                        break
-                    server_process.stdin.write(command + "\n")
-                    server_process.stdin.flush()
-                except (KeyboardInterrupt, EOFError):
-                    print("\nStopping the server...")
-                    server_process.stdin.write("stop\n")
-                    server_process.stdin.flush()
-                    break
         else:
             print("Minecraft server is running in non-interactive mode. Check logs for server output.")
-            server_process.wait()
-            print("Server stopped.")
+        sys.stdout.flush()
+
+        pump_server_io(server_process, interactive)
+        server_process.wait()
+        print("Server stopped.")
     except FileNotFoundError:
         print("Java executable not found. Please ensure Java is installed and in your system's PATH.")
         os.abort()
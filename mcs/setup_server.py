@@ -1,4 +1,5 @@
 import os
+import shutil
 import subprocess
 import argparse
 import sys
@@ -50,12 +51,7 @@ def copy_startup_script(server_dir):
         sys.exit(1)
 
     try:
-        with open(script_path, "r") as f:
-            content = f.read()
-
-        with open(properties_path, "w") as f:
-            f.write(content)
-            
+        shutil.copyfile(script_path, properties_path)
         logging.info(f"Server startup script file copied to {properties_path}")
     except IOError as e:
         logging.error(f"Failed to copy startup script file: {e}")